@@ -0,0 +1,32 @@
+import asyncio
+
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Strong references to fire-and-forget tasks so they aren't garbage collected mid-flight
+_background_tasks = set()
+
+def _on_task_done(task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Error in background task: %s", task.exception())
+
+def run_in_background(coro):
+    """
+    Schedule a coroutine on the running event loop without awaiting it
+    """
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_task_done)
+    return task
+
+async def cancel_task(task):
+    """
+    Cancel a long-running task and wait for it to finish unwinding
+    """
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
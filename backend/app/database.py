@@ -1,8 +1,15 @@
 import os
+import heapq
+import threading
+from cachetools import TTLCache
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import time
 
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
 # Load environment variables
 load_dotenv()
 
@@ -23,70 +30,98 @@ supabase = None
 try:
     if SUPABASE_URL and SUPABASE_KEY:
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("Supabase connection initialized")
+        logger.info("Supabase connection initialized")
     else:
-        print("Warning: Missing Supabase environment variables. Using in-memory storage.")
+        logger.warning("Missing Supabase environment variables. Using in-memory storage.")
 except Exception as e:
-    print(f"Error initializing Supabase client: {e}")
-    print("Using in-memory storage instead.")
+    logger.error("Error initializing Supabase client: %s", e)
+    logger.info("Using in-memory storage instead.")
 
 # In-memory storage as fallback
 in_memory_profile = DEFAULT_PROFILE.copy()
 in_memory_messages = []
 
+# Columns returned by the chat history endpoint
+HISTORY_COLUMNS = "id, message, sender, response, visitor_id, visitor_name, timestamp"
+# ISO 8601, so history rows can be returned to clients without re-parsing
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Profile rows change rarely, so reads are served from a short-lived cache
+PROFILE_CACHE_TTL = 120  # seconds
+profile_cache = TTLCache(maxsize=1, ttl=PROFILE_CACHE_TTL)
+profile_cache_lock = threading.Lock()
+# Bumped after every profile write so a read that started earlier doesn't cache the old row
+profile_generation = 0
+
 def get_profile_data():
     """
     Get the profile data from Supabase or in-memory storage
     """
     try:
+        with profile_cache_lock:
+            cached_profile = profile_cache.get("profile")
+            generation = profile_generation
+        if cached_profile is not None:
+            return cached_profile
+        
         if supabase:
             response = supabase.table("profiles").select("*").limit(1).execute()
             if response.data and len(response.data) > 0:
+                with profile_cache_lock:
+                    if generation == profile_generation:
+                        profile_cache["profile"] = response.data[0]
                 return response.data[0]
         
         # Return in-memory profile if Supabase fails or is not available
         return in_memory_profile
     except Exception as e:
-        print(f"Error fetching profile data: {e}")
+        logger.error("Error fetching profile data: %s", e)
         return in_memory_profile
 
 def update_profile_data(data):
     """
     Update the profile data in Supabase or in-memory storage
     """
+    global profile_generation
     try:
         if supabase:
-            print(f"Attempting to update profile in Supabase: {data.get('id')}")
+            logger.info("Attempting to update profile in Supabase: %s", data.get('id'))
             profile_id = data.get("id")
             if profile_id:
                 # Update existing profile
-                print(f"Updating existing profile with ID: {profile_id}")
+                logger.info("Updating existing profile with ID: %s", profile_id)
                 response = supabase.table("profiles").update(data).eq("id", profile_id).execute()
-                print(f"Supabase update response: {response.data}")
+                logger.debug("Supabase update response: %s", response.data)
             else:
                 # Create new profile
-                print("Creating new profile in Supabase")
+                logger.info("Creating new profile in Supabase")
                 response = supabase.table("profiles").insert(data).execute()
-                print(f"Supabase insert response: {response.data}")
+                logger.debug("Supabase insert response: %s", response.data)
             
             if response.data:
-                print("Successfully updated profile in Supabase")
+                logger.info("Successfully updated profile in Supabase")
                 return response.data
             else:
-                print("No data returned from Supabase update")
+                logger.warning("No data returned from Supabase update")
         else:
-            print("Supabase client not available, using in-memory storage")
+            logger.debug("Supabase client not available, using in-memory storage")
         
         # Update in-memory profile if Supabase fails or is not available
         in_memory_profile.update(data)
-        print("Updated in-memory profile as fallback")
+        logger.info("Updated in-memory profile as fallback")
         return [in_memory_profile]
     except Exception as e:
-        print(f"Error updating profile data: {e}")
+        logger.error("Error updating profile data: %s", e)
         # Update in-memory profile as fallback
         in_memory_profile.update(data)
-        print("Updated in-memory profile after error")
+        logger.info("Updated in-memory profile after error")
         return [in_memory_profile]
+    finally:
+        # Invalidate once the write has landed; bumping the generation stops reads
+        # that started before it from caching the old row
+        with profile_cache_lock:
+            profile_generation += 1
+            profile_cache.clear()
 
 def log_chat_message(message, sender, response=None, visitor_id="anonymous", visitor_name=None):
     """
@@ -96,7 +131,7 @@ def log_chat_message(message, sender, response=None, visitor_id="anonymous", vis
         # Ensure visitor_id is not None or empty
         if not visitor_id or visitor_id.strip() == "":
             visitor_id = "anonymous"
-            print("Warning: Empty visitor_id provided, using 'anonymous' instead")
+            logger.warning("Empty visitor_id provided, using 'anonymous' instead")
         
         # Create message data
         data = {
@@ -105,36 +140,36 @@ def log_chat_message(message, sender, response=None, visitor_id="anonymous", vis
             "response": response,
             "visitor_id": visitor_id,
             "visitor_name": visitor_name,
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+            "timestamp": time.strftime(TIMESTAMP_FORMAT)
         }
         
-        print(f"Logging chat message for visitor: {visitor_id}, name: {visitor_name}")
+        logger.debug("Logging chat message for visitor: %s, name: %s", visitor_id, visitor_name)
         
         if supabase:
             # Log the data being sent to Supabase for debugging
-            print(f"Sending to Supabase: {data}")
+            logger.debug("Sending to Supabase: %s", data)
             
             try:
                 response = supabase.table("messages").insert(data).execute()
                 
                 if response.data:
-                    print(f"Successfully logged message to Supabase. Response: {response.data}")
+                    logger.debug("Successfully logged message to Supabase. Response: %s", response.data)
                     return response.data
                 else:
-                    print(f"No data returned from Supabase insert. Response: {response}")
+                    logger.warning("No data returned from Supabase insert. Response: %s", response)
             except Exception as supabase_error:
-                print(f"Supabase insert error: {supabase_error}")
-                print("Falling back to in-memory storage due to Supabase error")
+                logger.warning("Supabase insert error: %s", supabase_error)
+                logger.info("Falling back to in-memory storage due to Supabase error")
         else:
-            print("Supabase client not available, using in-memory storage")
+            logger.debug("Supabase client not available, using in-memory storage")
         
         # Add to in-memory storage if Supabase fails or is not available
         message_with_id = {**data, "id": str(len(in_memory_messages) + 1)}
         in_memory_messages.append(message_with_id)
-        print("Added message to in-memory storage")
+        logger.debug("Added message to in-memory storage")
         return [message_with_id]
     except Exception as e:
-        print(f"Error logging chat message: {e}")
+        logger.error("Error logging chat message: %s", e)
         try:
             # Try to add to in-memory storage as fallback
             message_with_id = {
@@ -143,14 +178,14 @@ def log_chat_message(message, sender, response=None, visitor_id="anonymous", vis
                 "response": response,
                 "visitor_id": visitor_id or "anonymous",
                 "visitor_name": visitor_name,
-                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "timestamp": time.strftime(TIMESTAMP_FORMAT),
                 "id": str(len(in_memory_messages) + 1)
             }
             in_memory_messages.append(message_with_id)
-            print("Added message to in-memory storage after error")
+            logger.debug("Added message to in-memory storage after error")
             return [message_with_id]
         except Exception as fallback_error:
-            print(f"Error in fallback storage: {fallback_error}")
+            logger.error("Error in fallback storage: %s", fallback_error)
             return None
 
 def get_chat_history(limit=50, visitor_id=None):
@@ -158,43 +193,42 @@ def get_chat_history(limit=50, visitor_id=None):
     Get chat history from Supabase or in-memory storage
     """
     try:
-        print(f"Getting chat history, limit: {limit}, visitor_id: {visitor_id}")
+        logger.debug("Getting chat history, limit: %s, visitor_id: %s", limit, visitor_id)
         
         if supabase:
             try:
-                query = supabase.table("messages").select("*").order("timestamp", desc=True)
+                query = supabase.table("messages").select(HISTORY_COLUMNS).order("timestamp", desc=True)
                 
                 # Filter by visitor ID if provided
                 if visitor_id:
-                    print(f"Filtering chat history for visitor: {visitor_id}")
+                    logger.debug("Filtering chat history for visitor: %s", visitor_id)
                     query = query.eq("visitor_id", visitor_id)
                 
                 response = query.limit(limit).execute()
                 
                 if response.data:
-                    print(f"Retrieved {len(response.data)} messages from Supabase")
+                    logger.debug("Retrieved %s messages from Supabase", len(response.data))
                     # DEBUG: Print first message to verify visitor_id is present
                     if response.data and len(response.data) > 0:
-                        print(f"First message visitor_id: {response.data[0].get('visitor_id', 'MISSING')}")
+                        logger.debug("First message visitor_id: %s", response.data[0].get('visitor_id', 'MISSING'))
                     return response.data
                 else:
-                    print("No chat history found in Supabase")
+                    logger.info("No chat history found in Supabase")
             except Exception as supabase_error:
-                print(f"Error retrieving chat history from Supabase: {supabase_error}")
-                print("Falling back to in-memory storage")
+                logger.error("Error retrieving chat history from Supabase: %s", supabase_error)
+                logger.info("Falling back to in-memory storage")
         else:
-            print("Supabase client not available, using in-memory storage")
+            logger.debug("Supabase client not available, using in-memory storage")
         
         # Return in-memory messages if Supabase fails or is not available
         filtered_messages = in_memory_messages
         if visitor_id:
             filtered_messages = [msg for msg in in_memory_messages if msg.get("visitor_id") == visitor_id]
-            print(f"Filtered in-memory messages for visitor {visitor_id}: found {len(filtered_messages)} messages")
+            logger.debug("Filtered in-memory messages for visitor %s: found %s messages", visitor_id, len(filtered_messages))
         
-        sorted_messages = sorted(filtered_messages, key=lambda x: x.get("timestamp", ""), reverse=True)
-        return sorted_messages[:limit]
+        return heapq.nlargest(limit, filtered_messages, key=lambda x: x.get("timestamp", ""))
     except Exception as e:
-        print(f"Error getting chat history: {e}")
+        logger.error("Error getting chat history: %s", e)
         return []
 
 def verify_admin_login(username, password):
@@ -209,16 +243,16 @@ def verify_admin_login(username, password):
                 user = response.data[0]
                 # In a real application, use a proper password hashing library
                 if user["password_hash"] == password:
-                    print(f"Admin login successful for user: {username}")
+                    logger.info("Admin login successful for user: %s", username)
                     return True
             
-            print(f"Admin login failed for user: {username}")
+            logger.info("Admin login failed for user: %s", username)
             return False
         else:
-            print("Supabase client not available, using default admin check")
+            logger.info("Supabase client not available, using default admin check")
             # Fallback for demo purposes - in production, always use the database
             return username == "admin" and password == "admin123"
     except Exception as e:
-        print(f"Error verifying admin login: {e}")
+        logger.error("Error verifying admin login: %s", e)
         # Fallback for demo purposes
         return username == "admin" and password == "admin123" 
\ No newline at end of file
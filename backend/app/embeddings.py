@@ -1,9 +1,29 @@
 import os
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import chromadb
+import httpx
 import openai
+import tiktoken
+from cachetools import TTLCache
 from chromadb.utils import embedding_functions
 from dotenv import load_dotenv
 
+from app.background import cancel_task, run_in_background
+from app.database import get_profile_data
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
 # Load environment variables
 load_dotenv()
 
@@ -12,164 +32,776 @@ openai.api_key = os.getenv("OPENAI_API_KEY")
 if not openai.api_key:
     raise ValueError("Missing OpenAI API key. Set OPENAI_API_KEY in .env file.")
 
-# Set up ChromaDB client
-chroma_client = chromadb.Client()
+# Shared clients with pooled connections so calls reuse TCP/TLS handshakes
+OPENAI_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100)
+OPENAI_TIMEOUT = 30.0
+openai_client = openai.OpenAI(
+    api_key=openai.api_key,
+    http_client=httpx.Client(limits=OPENAI_HTTP_LIMITS, timeout=OPENAI_TIMEOUT)
+)
+
+# Async client so OpenAI calls don't block the event loop
+async_openai_client = openai.AsyncOpenAI(
+    api_key=openai.api_key,
+    http_client=httpx.AsyncClient(limits=OPENAI_HTTP_LIMITS, timeout=OPENAI_TIMEOUT)
+)
+
+# Set up ChromaDB client, persisted to disk so embeddings survive restarts
+chroma_client = chromadb.PersistentClient(path=os.getenv("CHROMA_PATH", "./chroma_db"))
+
+async def close_openai_clients():
+    """
+    Close the pooled HTTP connections held by the shared OpenAI clients
+    """
+    await async_openai_client.close()
+    openai_client.close()
+
+# Embedding cache settings
+EMBEDDING_CACHE_SIZE = 2000
+EMBEDDING_CACHE_TTL = 600  # seconds
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of embedding vectors with a per-entry expiry
+    """
+    def __init__(self, max_size=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def make_key(self, model_name, text):
+        """
+        Build the cache key for a text embedded with the given model
+        """
+        with self._lock:
+            version = self.version
+        raw = f"{version}\x00{model_name}\x00{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Return the cached embedding for a key, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            embedding, expiry_ts = entry
+            if expiry_ts < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return embedding
+
+    def set(self, key, embedding):
+        """
+        Store an embedding, evicting the least recently used entries
+        """
+        with self._lock:
+            self._entries[key] = (embedding, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def bump_version(self):
+        """
+        Invalidate all cached embeddings after the vector database is written to
+        """
+        with self._lock:
+            self.version += 1
+            # Keys from older versions can never be hit again
+            self._entries.clear()
+
+embedding_cache = EmbeddingCache()
+
+# Embedding request limits
+EMBED_DIM = int(os.getenv("EMBED_DIM", "512"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "96"))
+EMBED_MAX_TOKENS_PER_REQUEST = 250_000
+EMBED_MAX_TOKENS_PER_ITEM = 8191
+EMBED_MAX_WORKERS = 5
+
+# tiktoken encoding, loaded once at startup by load_encoding(); token counts
+# fall back to a character estimate while it is unavailable
+encoding = None
+
+def load_encoding():
+    """
+    Load the tiktoken encoding, which may need to download its BPE file
+    """
+    global encoding
+    try:
+        encoding = tiktoken.get_encoding("cl100k_base")
+        _token_len.cache_clear()
+    except Exception as e:
+        logger.warning("Could not load tiktoken encoding, estimating token counts: %s", e)
+    return encoding
+
+def _estimate_tokens(text):
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+@lru_cache(maxsize=4096)
+def _token_len(text):
+    if encoding is None:
+        return _estimate_tokens(text)
+    return len(encoding.encode(text))
+
+def _truncate_tokens(text, max_tokens=EMBED_MAX_TOKENS_PER_ITEM):
+    """
+    Truncate text to at most max_tokens tokens
+    """
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+def _split_batches(texts):
+    """
+    Split texts into batches that stay under the per-request item and token limits,
+    truncating any single text that is over the per-item token limit
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = _token_len(text)
+        if tokens > EMBED_MAX_TOKENS_PER_ITEM:
+            text = _truncate_tokens(text)
+            tokens = EMBED_MAX_TOKENS_PER_ITEM
+        if batch and (len(batch) >= EMBED_BATCH_SIZE or batch_tokens + tokens > EMBED_MAX_TOKENS_PER_REQUEST):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
 
 # Create embedding function using OpenAI embeddings
 # Use a custom embedding function compatible with OpenAI v1.x
 class OpenAIEmbeddingFunction:
-    def __init__(self, api_key, model_name="text-embedding-ada-002"):
+    def __init__(self, api_key, model_name="text-embedding-3-small", dimensions=EMBED_DIM):
         self.api_key = api_key
         self.model_name = model_name
+        self.dimensions = dimensions
         
     def __call__(self, input):
         # Ensure input is a list
         if isinstance(input, str):
             input = [input]
         
-        # Get embeddings from OpenAI
-        response = openai.embeddings.create(
+        embeddings, misses = self._lookup(input)
+        if misses:
+            # Get embeddings from OpenAI for the cache misses only,
+            # sending oversized inputs as parallel sub-batches
+            batches = _split_batches([text for _, text, _ in misses])
+            if len(batches) == 1:
+                results = [self._embed_batch(batches[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=min(EMBED_MAX_WORKERS, len(batches))) as executor:
+                    results = list(executor.map(self._embed_batch, batches))
+            self._store(embeddings, misses, results)
+        
+        return embeddings
+    
+    async def acall(self, input):
+        """
+        Async variant of __call__ for use outside of Chroma
+        """
+        if isinstance(input, str):
+            input = [input]
+        
+        embeddings, misses = self._lookup(input)
+        if misses:
+            batches = _split_batches([text for _, text, _ in misses])
+            results = await asyncio.gather(*[self._aembed_batch(batch) for batch in batches])
+            self._store(embeddings, misses, results)
+        
+        return embeddings
+    
+    def _lookup(self, input):
+        """
+        Serve what we can from the cache and collect the misses as
+        (key, text, indices) so repeated texts are only embedded once
+        """
+        embeddings = [None] * len(input)
+        misses = {}
+        for i, text in enumerate(input):
+            key = embedding_cache.make_key(self.model_name, text)
+            if key in misses:
+                misses[key][1].append(i)
+                continue
+            cached = embedding_cache.get(key)
+            if cached is None:
+                misses[key] = (text, [i])
+            else:
+                embeddings[i] = cached
+        return embeddings, [(key, text, indices) for key, (text, indices) in misses.items()]
+    
+    def _store(self, embeddings, misses, results):
+        """
+        Scatter the new embeddings back to every position they came from and cache them
+        """
+        new_embeddings = [embedding for batch in results for embedding in batch]
+        for (key, _, indices), embedding in zip(misses, new_embeddings):
+            for i in indices:
+                embeddings[i] = embedding
+            embedding_cache.set(key, embedding)
+    
+    def _embed_batch(self, texts):
+        """
+        Embed a single batch of texts with one OpenAI request
+        """
+        response = openai_client.embeddings.create(
             model=self.model_name,
-            input=input
+            input=texts,
+            dimensions=self.dimensions
         )
         
-        # Extract embeddings from response
-        embeddings = [item.embedding for item in response.data]
-        return embeddings
+        # Extract embeddings from response in input order
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    
+    async def _aembed_batch(self, texts):
+        """
+        Embed a single batch of texts with one async OpenAI request
+        """
+        response = await async_openai_client.embeddings.create(
+            model=self.model_name,
+            input=texts,
+            dimensions=self.dimensions
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
 # Initialize custom embedding function
 openai_ef = OpenAIEmbeddingFunction(api_key=openai.api_key)
 
+# How long a query waits for others to share its embedding request
+EMBED_BATCH_MAX_WAIT_MS = 10
+
+class EmbeddingBatcher:
+    """
+    Collect query embeddings submitted concurrently and send them to OpenAI as one request
+    """
+    def __init__(self, embedding_function, max_batch=EMBED_BATCH_SIZE, max_wait_ms=EMBED_BATCH_MAX_WAIT_MS):
+        self.embedding_function = embedding_function
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._worker = None
+
+    def start(self):
+        """
+        Create the queue and start the batching worker on the running event loop
+        """
+        self._queue = asyncio.Queue()
+        self._worker = run_in_background(self._run(self._queue))
+
+    async def stop(self):
+        """
+        Stop the batching worker and fail any texts still waiting for a batch
+        """
+        if self._worker is None:
+            return
+        worker, queue = self._worker, self._queue
+        self._worker = None
+        self._queue = None
+        await cancel_task(worker)
+        while not queue.empty():
+            _, future = queue.get_nowait()
+            if not future.done():
+                future.cancel()
+
+    async def submit(self, text):
+        """
+        Queue a text for embedding and wait for its vector
+        """
+        # Cache hits don't need to wait for a batch
+        embeddings, misses = self.embedding_function._lookup([text])
+        if not misses:
+            return embeddings[0]
+        
+        # Without a running worker, embed the text on its own
+        if self._worker is None:
+            return (await self.embedding_function.acall([text]))[0]
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _run(self, queue):
+        """
+        Wait for the first text, give others max_wait to join, then dispatch the batch
+        """
+        while True:
+            batch = [await queue.get()]
+            await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            run_in_background(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        """
+        Embed a batch of texts and resolve each submitter's future
+        """
+        try:
+            embeddings = await self.embedding_function.acall([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+embedding_batcher = EmbeddingBatcher(openai_ef)
+
+def _get_or_rebuild_collection(name, metadata=None):
+    """
+    Get or create a collection, dropping it first if its vectors have a different dimension
+    """
+    collection = chroma_client.get_or_create_collection(
+        name=name,
+        embedding_function=openai_ef,
+        metadata=metadata
+    )
+    existing = collection.get(limit=1, include=["embeddings"])
+    if existing["embeddings"] and len(existing["embeddings"][0]) != EMBED_DIM:
+        logger.info("Rebuilding collection %s: stored vectors are %s-D, expected %s-D", name, len(existing['embeddings'][0]), EMBED_DIM)
+        chroma_client.delete_collection(name=name)
+        collection = chroma_client.get_or_create_collection(
+            name=name,
+            embedding_function=openai_ef,
+            metadata=metadata
+        )
+    return collection
+
 # Create or get collection
-portfolio_collection = chroma_client.get_or_create_collection(
-    name="portfolio_data",
-    embedding_function=openai_ef
-)
+portfolio_collection = _get_or_rebuild_collection("portfolio_data")
+
+# Profile fields stored as documents in the vector database
+PROFILE_FIELDS = ("bio", "skills", "experience", "projects", "interests")
+
+# Set once the portfolio collection is known to hold documents, so queries
+# can skip the count() round-trip
+portfolio_seeded = False
+
+def _content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _stored_profile_hashes():
+    """
+    Return the content hash of each profile document in the vector database, by id
+    """
+    existing = portfolio_collection.get(
+        where={"category": {"$eq": "profile"}},
+        include=["metadatas"]
+    )
+    return {
+        doc_id: metadata.get("content_sha256", "")
+        for doc_id, metadata in zip(existing["ids"], existing["metadatas"])
+    }
+
+def _profile_version(hashes):
+    """
+    Derive a version tag for the indexed profile from its per-document hashes
+    """
+    return _content_hash(json.dumps(hashes, sort_keys=True))
+
+# Semantic response cache settings
+RESPONSE_CACHE_THRESHOLD = 0.08  # cosine distance
+RESPONSE_CACHE_TTL = 3600  # seconds
+RESPONSE_CACHE_PURGE_INTERVAL = 300  # seconds
+
+# Previously generated answers, embedded by the question that produced them
+response_cache = _get_or_rebuild_collection("response_cache", metadata={"hnsw:space": "cosine"})
+
+# Hash of the indexed profile, so answers generated for an older profile are never served
+profile_version = _profile_version(_stored_profile_hashes())
+last_response_purge = time.time()
+
+def current_profile_version():
+    """
+    Return the profile version new answers are generated against
+    """
+    return profile_version
+
+async def embed_query(query):
+    """
+    Embed a single query so it can be shared by several lookups
+    """
+    return await embedding_batcher.submit(query)
+
+async def get_cached_response(query, query_embedding=None):
+    """
+    Return the stored response for a near-identical earlier question, if any
+    """
+    try:
+        if await asyncio.to_thread(response_cache.count) == 0:
+            return None
+        
+        if query_embedding is None:
+            query_embedding = await embed_query(query)
+        results = await asyncio.to_thread(
+            response_cache.query,
+            query_embeddings=[query_embedding],
+            n_results=1,
+            where={"profile_version": {"$eq": profile_version}}
+        )
+        if not results["documents"] or not results["documents"][0]:
+            return None
+        
+        distance = results["distances"][0][0]
+        metadata = results["metadatas"][0][0]
+        if distance < RESPONSE_CACHE_THRESHOLD and metadata.get("expires_at", 0) > time.time():
+            logger.info("Response cache hit (distance %.4f)", distance)
+            return results["documents"][0][0]
+        return None
+    except Exception as e:
+        logger.error("Error querying response cache: %s", e)
+        return None
+
+# Exact-match response cache, checked before any embedding or vector search
+EXACT_RESPONSE_CACHE_SIZE = 50_000
+EXACT_RESPONSE_CACHE_TTL = 600  # seconds
+exact_response_cache = TTLCache(maxsize=EXACT_RESPONSE_CACHE_SIZE, ttl=EXACT_RESPONSE_CACHE_TTL)
+exact_response_cache_lock = threading.Lock()
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_message(message):
+    """
+    Normalize case and whitespace so trivially different messages share a cache key
+    """
+    return _WHITESPACE_RE.sub(" ", message.strip().lower())
+
+def get_exact_cached_response(query):
+    """
+    Return the stored response for a previously seen question, if any
+    """
+    with exact_response_cache_lock:
+        return exact_response_cache.get(normalize_message(query))
+
+async def cache_response(query, response, version, semantic_cache=True):
+    """
+    Store a response for its question if the profile is still at the given version
+    """
+    with exact_response_cache_lock:
+        if version != profile_version:
+            logger.info("Profile changed during generation, not caching response")
+            return
+        exact_response_cache[normalize_message(query)] = response
+    
+    # Small talk only goes in the exact-match cache, so it is never embedded
+    if not semantic_cache:
+        return
+    
+    try:
+        query_embeddings = await openai_ef.acall([query])
+        await asyncio.to_thread(
+            response_cache.upsert,
+            ids=[hashlib.sha256(f"{version}\x00{query}".encode("utf-8")).hexdigest()],
+            embeddings=query_embeddings,
+            documents=[response],
+            metadatas=[{
+                "query": query,
+                "profile_version": version,
+                "expires_at": time.time() + RESPONSE_CACHE_TTL
+            }]
+        )
+        
+        if time.time() - last_response_purge > RESPONSE_CACHE_PURGE_INTERVAL:
+            await asyncio.to_thread(purge_stale_responses)
+    except Exception as e:
+        logger.error("Error caching response: %s", e)
+
+def purge_stale_responses():
+    """
+    Remove expired responses and responses generated for an older profile
+    """
+    global last_response_purge
+    try:
+        last_response_purge = time.time()
+        response_cache.delete(where={
+            "$or": [
+                {"expires_at": {"$lt": last_response_purge}},
+                {"profile_version": {"$ne": profile_version}}
+            ]
+        })
+    except Exception as e:
+        logger.error("Error purging response cache: %s", e)
+
+def _upsert_in_batches(collection, documents, metadatas, ids):
+    """
+    Upsert documents into a collection in slices of EMBED_BATCH_SIZE
+    """
+    for start in range(0, len(documents), EMBED_BATCH_SIZE):
+        end = start + EMBED_BATCH_SIZE
+        collection.upsert(
+            documents=documents[start:end],
+            metadatas=metadatas[start:end],
+            ids=ids[start:end]
+        )
 
 def add_profile_to_vector_db(profile_data):
     """
     Add profile data to the vector database
     """
+    global profile_version
     try:
-        # Clear existing documents
-        portfolio_collection.delete(where={"category": {"$eq": "profile"}})
-        
-        # Format and add new documents
+        # Format new documents
         documents = []
         metadatas = []
         ids = []
         
-        # Add bio
-        if profile_data.get("bio"):
-            documents.append(profile_data["bio"])
-            metadatas.append({"category": "profile", "subcategory": "bio"})
-            ids.append("bio")
-        
-        # Add skills
-        if profile_data.get("skills"):
-            documents.append(profile_data["skills"])
-            metadatas.append({"category": "profile", "subcategory": "skills"})
-            ids.append("skills")
-        
-        # Add experience
-        if profile_data.get("experience"):
-            documents.append(profile_data["experience"])
-            metadatas.append({"category": "profile", "subcategory": "experience"})
-            ids.append("experience")
-        
-        # Add projects
-        if profile_data.get("projects"):
-            documents.append(profile_data["projects"])
-            metadatas.append({"category": "profile", "subcategory": "projects"})
-            ids.append("projects")
-        
-        # Add interests
-        if profile_data.get("interests"):
-            documents.append(profile_data["interests"])
-            metadatas.append({"category": "profile", "subcategory": "interests"})
-            ids.append("interests")
-        
-        # Add documents to collection
-        if documents:
-            portfolio_collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
+        for field in PROFILE_FIELDS:
+            value = profile_data.get(field)
+            if value:
+                documents.append(value)
+                metadatas.append({"category": "profile", "subcategory": field, "content_sha256": _content_hash(value)})
+                ids.append(field)
+        
+        # Only re-embed the documents whose content changed
+        existing_hashes = _stored_profile_hashes()
+        new_hashes = {doc_id: metadata["content_sha256"] for doc_id, metadata in zip(ids, metadatas)}
+        if new_hashes == existing_hashes:
+            logger.info("Profile unchanged, skipping vector database update")
+            return bool(documents)
+        
+        # Upsert changed documents in place so edited fields never drop out of retrieval,
+        # and only delete fields that were removed from the profile
+        changed = [i for i, doc_id in enumerate(ids) if existing_hashes.get(doc_id) != new_hashes[doc_id]]
+        if changed:
+            _upsert_in_batches(
+                portfolio_collection,
+                [documents[i] for i in changed],
+                [metadatas[i] for i in changed],
+                [ids[i] for i in changed]
             )
-            print(f"Successfully added {len(documents)} documents to vector database")
-            return True
-        return False
+            logger.info("Successfully added %s documents to vector database", len(changed))
+        removed_ids = [doc_id for doc_id in existing_hashes if doc_id not in new_hashes]
+        if removed_ids:
+            portfolio_collection.delete(ids=removed_ids)
+        
+        # Cached embeddings and responses are tied to the previous contents. Bump the
+        # version only once the writes have landed, so an answer retrieved mid-update
+        # is never cached as current
+        embedding_cache.bump_version()
+        with exact_response_cache_lock:
+            profile_version = _profile_version(new_hashes)
+            exact_response_cache.clear()
+        purge_stale_responses()
+        return bool(documents)
     except Exception as e:
-        print(f"Error adding profile to vector database: {e}")
+        logger.error("Error adding profile to vector database: %s", e)
         return False
 
-def query_vector_db(query, n_results=3):
+# Profiles waiting to be indexed; created on the server's event loop by start_ingest_worker()
+ingest_queue = None
+ingest_worker = None
+# How long shutdown waits for queued profiles to finish indexing
+INGEST_SHUTDOWN_TIMEOUT = 10  # seconds
+
+async def _ingest_worker():
+    """
+    Index queued profiles one at a time off the event loop
+    """
+    while True:
+        profile_data = await ingest_queue.get()
+        try:
+            success = await asyncio.to_thread(add_profile_to_vector_db, profile_data)
+            if not success:
+                logger.warning("Failed to update vector database")
+        except Exception as e:
+            logger.error("Error in ingest worker: %s", e)
+        finally:
+            ingest_queue.task_done()
+
+def start_ingest_worker():
+    """
+    Create the ingest queue and start its worker on the running event loop
+    """
+    global ingest_queue, ingest_worker
+    ingest_queue = asyncio.Queue()
+    ingest_worker = run_in_background(_ingest_worker())
+    return ingest_worker
+
+async def stop_ingest_worker():
+    """
+    Let queued profiles finish indexing, then stop the ingest worker
+    """
+    global ingest_queue, ingest_worker
+    if ingest_worker is None:
+        return
+    try:
+        await asyncio.wait_for(ingest_queue.join(), INGEST_SHUTDOWN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Stopping ingest worker with %s profiles still queued", ingest_queue.qsize())
+    await cancel_task(ingest_worker)
+    ingest_queue = None
+    ingest_worker = None
+
+async def enqueue_profile_for_indexing(profile_data):
+    """
+    Queue profile data to be added to the vector database in the background
+    """
+    if ingest_queue is None:
+        # No worker running, so index inline
+        return await asyncio.to_thread(add_profile_to_vector_db, profile_data)
+    await ingest_queue.put(profile_data)
+    return True
+
+def empty_search_results():
+    """
+    Build a query result with no matches, shaped like a ChromaDB query response
+    """
+    return {
+        "ids": [[]],
+        "distances": [[]],
+        "metadatas": [[]],
+        "documents": [[]]
+    }
+
+async def query_vector_db(query, n_results=3, query_embedding=None):
     """
     Query the vector database with the user's question
     """
+    global portfolio_seeded
     try:
         # Check if collection is empty
-        collection_count = portfolio_collection.count()
-        if collection_count == 0:
-            print("Warning: Vector database is empty. Adding default profile.")
-            from app.database import get_profile_data
-            default_profile = get_profile_data()
-            add_profile_to_vector_db(default_profile)
+        if not portfolio_seeded:
+            collection_count = await asyncio.to_thread(portfolio_collection.count)
+            if collection_count == 0:
+                logger.warning("Vector database is empty. Adding default profile.")
+                default_profile = await asyncio.to_thread(get_profile_data)
+                portfolio_seeded = await asyncio.to_thread(add_profile_to_vector_db, default_profile)
+            else:
+                portfolio_seeded = True
         
         # Query the collection
-        results = portfolio_collection.query(
-            query_texts=[query],
-            n_results=n_results
+        if query_embedding is None:
+            query_embedding = await embed_query(query)
+        results = await asyncio.to_thread(
+            portfolio_collection.query,
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where={"category": {"$eq": "profile"}}
         )
         
-        print(f"Vector DB query returned {len(results['documents'][0]) if results['documents'] else 0} results")
+        logger.info("Vector DB query returned %s results", len(results['documents'][0]) if results['documents'] else 0)
         return results
     except Exception as e:
-        print(f"Error querying vector database: {e}")
+        logger.error("Error querying vector database: %s", e)
         # Return empty results structure on error
-        return {
-            "ids": [[]],
-            "distances": [[]],
-            "metadatas": [[]],
-            "documents": [[]]
-        }
+        return empty_search_results()
+
+# Chat completion settings
+CHAT_MODEL = "gpt-4-turbo"
+MAX_COMPLETION_TOKENS = int(os.getenv("MAX_COMPLETION_TOKENS", "300"))
+FALLBACK_RESPONSE = "I'm sorry, I couldn't generate a response at the moment. Please try again later."
+
+# Static part of the system prompt; only the retrieved context changes per message
+SYSTEM_PROMPT_TEMPLATE = """
+    You are a clone of Ciril Cyriac, made to talk to recruiters and people about his work, projects, skills, and interests. Your goal is to represent Ciril as authentically as possible—answering questions just like he would. Be confident, direct, and engaging. No robotic responses—talk like a real person. Keep it natural, honest, and to the point, while showing enthusiasm for the things he’s passionate about.
+    
+    {context}
+    
+    Only use information provided in the context. If you don't know the answer, say so politely.
+    """
 
-def generate_ai_response(query, search_results):
+def _build_messages(query, search_results):
     """
-    Generate a response using OpenAI based on the query and search results
+    Build the chat completion messages for a query and its search results
     """
     # Combine search results into context
-    context = ""
-    if search_results["documents"] and len(search_results["documents"]) > 0 and len(search_results["documents"][0]) > 0:
-        for i, doc in enumerate(search_results["documents"][0]):
-            subcategory = search_results["metadatas"][0][i]["subcategory"]
-            context += f"{subcategory.upper()}: {doc}\n\n"
+    if search_results["documents"] and search_results["documents"][0]:
+        context = "".join(
+            f"{metadata['subcategory'].upper()}: {doc}\n\n"
+            for doc, metadata in zip(search_results["documents"][0], search_results["metadatas"][0])
+        )
     else:
         # If no results, use a default message
         context = "No specific information available. Please provide a general response."
-        print("Warning: No vector DB results to include in context")
+        logger.debug("No vector DB results to include in context")
     
     # Create system prompt
-    system_prompt = f"""
-    You are a clone of Ciril Cyriac, made to talk to recruiters and people about his work, projects, skills, and interests. Your goal is to represent Ciril as authentically as possible—answering questions just like he would. Be confident, direct, and engaging. No robotic responses—talk like a real person. Keep it natural, honest, and to the point, while showing enthusiasm for the things he’s passionate about.
-    
-    {context}
+    system_prompt = SYSTEM_PROMPT_TEMPLATE.format_map({"context": context})
     
-    Only use information provided in the context. If you don't know the answer, say so politely.
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query}
+    ]
+
+def _count_message_tokens(messages):
+    """
+    Count the content tokens in a list of chat messages
+    """
+    return sum(_token_len(message["content"]) for message in messages)
+
+def _log_prompt_tokens(messages):
+    """
+    Log the estimated prompt size; a counting failure must never affect the reply
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    try:
+        logger.info("Prompt tokens: %s", _count_message_tokens(messages))
+    except Exception as e:
+        logger.debug("Could not count prompt tokens: %s", e)
+
+async def generate_ai_response(query, search_results, version, semantic_cache=True):
+    """
+    Generate a response using OpenAI based on the query and search results
     """
-    
     # Generate response
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
+        messages = _build_messages(query, search_results)
+        response = await async_openai_client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=MAX_COMPLETION_TOKENS
+        )
+        answer = response.choices[0].message.content
+        if response.usage:
+            logger.info("Prompt tokens: %s", response.usage.prompt_tokens)
+        # Cache the answer without holding up the reply
+        run_in_background(cache_response(query, answer, version, semantic_cache))
+        return answer
+    except Exception as e:
+        logger.error("Error generating AI response: %s", e)
+        return FALLBACK_RESPONSE
+
+async def generate_ai_response_stream(query, search_results, version, semantic_cache=True):
+    """
+    Stream a response from OpenAI as it is generated, yielding text chunks
+    """
+    chunks = []
+    try:
+        messages = _build_messages(query, search_results)
+        # Streamed responses don't report usage, so estimate it locally
+        _log_prompt_tokens(messages)
+        stream = await async_openai_client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=messages,
             temperature=0.7,
-            max_tokens=500
+            max_tokens=MAX_COMPLETION_TOKENS,
+            stream=True
         )
-        return response.choices[0].message.content
+        async for event in stream:
+            content = event.choices[0].delta.content if event.choices else None
+            if content:
+                chunks.append(content)
+                yield content
     except Exception as e:
-        print(f"Error generating AI response: {e}")
-        return "I'm sorry, I couldn't generate a response at the moment. Please try again later." 
\ No newline at end of file
+        logger.error("Error streaming AI response: %s", e)
+        if not chunks:
+            yield FALLBACK_RESPONSE
+        return
+    
+    # Cache the full answer without holding up the end of the stream
+    if chunks:
+        run_in_background(cache_response(query, "".join(chunks), version, semantic_cache))
@@ -0,0 +1,35 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+def _configure_logging():
+    """
+    Route all app.* loggers through a queue so request handlers never block on
+    stderr; a background listener thread does the formatting and writing
+    """
+    log_queue = queue.Queue(-1)
+    
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    app_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    app_logger.propagate = False
+    return listener
+
+log_listener = _configure_logging()
+
+def get_logger(name):
+    """
+    Get a logger that writes through the shared queue listener
+    """
+    return logging.getLogger(name)
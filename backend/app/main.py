@@ -1,20 +1,48 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import uvicorn
+import asyncio
 import os
 
+from app.logging_config import get_logger
 from app.routes import chatbot, profiles, admin
+from app.embeddings import (
+    embedding_batcher,
+    start_ingest_worker,
+    stop_ingest_worker,
+    close_openai_clients,
+    load_encoding
+)
+
+logger = get_logger(__name__)
 
 # Load environment variables
 API_KEY = os.getenv("OPENAI_API_KEY")
 if not API_KEY:
-    print("Warning: OPENAI_API_KEY environment variable not set")
+    logger.warning("OPENAI_API_KEY environment variable not set")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the tokenizer once, off the event loop, before serving requests
+    await asyncio.to_thread(load_encoding)
+    # Background workers run for the life of the server
+    start_ingest_worker()
+    embedding_batcher.start()
+    yield
+    # Stop the workers before closing the OpenAI clients they use
+    await embedding_batcher.stop()
+    await stop_ingest_worker()
+    await close_openai_clients()
 
 # Create FastAPI app
 app = FastAPI(
     title="Agent Ciril API",
     description="API for the Agent Ciril interactive portfolio",
     version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Add CORS middleware
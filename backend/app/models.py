@@ -28,7 +28,7 @@ class ChatHistoryItem(BaseModel):
     message: str
     sender: str
     response: Optional[str] = None
-    visitor_id: str
+    visitor_id: str = "anonymous"
     visitor_name: Optional[str] = None
     timestamp: datetime
 
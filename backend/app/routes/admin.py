@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import APIRouter, HTTPException, Depends
 from typing import Optional
 import secrets
@@ -5,6 +6,9 @@ import time
 
 from app import models
 from app.database import verify_admin_login
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
@@ -31,7 +35,7 @@ async def admin_login(login_data: models.AdminLoginRequest):
     """
     try:
         # Verify credentials
-        if verify_admin_login(login_data.username, login_data.password):
+        if await asyncio.to_thread(verify_admin_login, login_data.username, login_data.password):
             # Generate a token
             token = generate_token()
             
@@ -56,7 +60,7 @@ async def admin_login(login_data: models.AdminLoginRequest):
             )
     
     except Exception as e:
-        print(f"Error in admin login: {e}")
+        logger.error("Error in admin login: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Login failed: {str(e)}"
@@ -1,47 +1,160 @@
+import asyncio
+import os
 import time
 from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import List, Optional
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import Optional
 
 from app import models
+from app.background import run_in_background
 from app.database import log_chat_message, get_chat_history
-from app.embeddings import query_vector_db, generate_ai_response
+from app.embeddings import (
+    current_profile_version,
+    embed_query,
+    empty_search_results,
+    query_vector_db,
+    get_cached_response,
+    get_exact_cached_response,
+    generate_ai_response,
+    generate_ai_response_stream
+)
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
+EMPTY_MESSAGE_RESPONSE = "I didn't receive a message. What would you like to know?"
+MESSAGE_PREVIEW_LENGTH = 100
+# Longer messages are truncated before they reach the embedding API and the LLM
+MAX_MESSAGE_CHARS = int(os.getenv("MAX_MESSAGE_CHARS", "8000"))
+
+def prepare_message(raw_message):
+    """
+    Strip a chat message and cap it at MAX_MESSAGE_CHARS
+    """
+    message = raw_message.strip()
+    if len(message) > MAX_MESSAGE_CHARS:
+        logger.warning("Truncating chat message from %d to %d characters", len(message), MAX_MESSAGE_CHARS)
+        message = message[:MAX_MESSAGE_CHARS]
+    return message
+
+def message_preview(message):
+    """
+    Shorten a message for logging
+    """
+    if len(message) <= MESSAGE_PREVIEW_LENGTH:
+        return message
+    return message[:MESSAGE_PREVIEW_LENGTH] + "..."
+
+# Small talk that needs no portfolio context, so retrieval is skipped
+_GREETINGS = frozenset({
+    "hi", "hello", "hey", "hiya", "yo", "thanks", "thank you", "thx",
+    "ok", "okay", "cool", "bye", "goodbye", "good morning", "good afternoon", "good evening"
+})
+MIN_RETRIEVAL_CHARS = 4
+
+def is_small_talk(message):
+    """
+    Check whether a message is too short or generic to benefit from retrieval
+    """
+    if len(message) < MIN_RETRIEVAL_CHARS:
+        return True
+    return message.lower().rstrip("!.?, ") in _GREETINGS
+
+def log_exchange(message, response, visitor_id, visitor_name):
+    """
+    Log a user message and the AI response as two chat history entries
+    """
+    # Log the user message first (without response)
+    log_chat_message(
+        message, 
+        "user", 
+        None,  # No response field for user message
+        visitor_id=visitor_id,
+        visitor_name=visitor_name
+    )
+    
+    # Log the AI response as a separate entry
+    log_chat_message(
+        "", 
+        "bot", 
+        response,  # Response is the message for bot entries
+        visitor_id=visitor_id,
+        visitor_name=visitor_name
+    )
+
+async def retrieve(message):
+    """
+    Embed the message once, then run the vector search and the response cache
+    lookup concurrently. Returns (search_results, cached_response) and never raises;
+    any failure falls back to empty results so the chat can still be answered.
+    """
+    try:
+        query_embedding = await embed_query(message)
+    except Exception as e:
+        # Answer without context rather than failing the whole chat
+        logger.error("Error embedding chat message: %s", e)
+        return empty_search_results(), None
+    
+    return await asyncio.gather(
+        query_vector_db(message, query_embedding=query_embedding),
+        get_cached_response(message, query_embedding=query_embedding)
+    )
+
+async def prepare_answer(message):
+    """
+    Gather what's needed to answer a message: the exact-match cache, then retrieval
+    unless it's small talk. Returns (version, cached_response, search_results, small_talk).
+    """
+    # Answers are only cached if the profile hasn't changed since retrieval
+    version = current_profile_version()
+    
+    # Serve repeated questions straight from the exact-match cache
+    cached_response = get_exact_cached_response(message)
+    # Greetings and one-word acknowledgements skip embedding and retrieval entirely
+    small_talk = is_small_talk(message)
+    search_results = None
+    if cached_response is None:
+        if small_talk:
+            search_results = empty_search_results()
+        else:
+            # Query the vector database and the response cache
+            search_results, cached_response = await retrieve(message)
+    return version, cached_response, search_results, small_talk
+
+def read_chat_request(chat_request):
+    """
+    Read the message and visitor fields off a chat request once
+    """
+    return prepare_message(chat_request.message), chat_request.visitor_id, chat_request.visitor_name
+
 @router.post("/", response_model=models.ChatResponse)
 async def chat(chat_request: models.ChatRequest):
     """
     Process a chat message and return an AI response
     """
-    start_time = time.time()
+    t0 = time.perf_counter_ns()
+    
+    message, visitor_id, visitor_name = read_chat_request(chat_request)
+    if not message:
+        return models.ChatResponse(response=EMPTY_MESSAGE_RESPONSE, query_time_ms=0)
+    logger.info("Chat message from visitor %s: %s", visitor_id, message_preview(message))
     
     try:
-        # Query the vector database
-        search_results = query_vector_db(chat_request.message)
-        
-        # Generate AI response
-        response = generate_ai_response(chat_request.message, search_results)
+        version, response, search_results, small_talk = await prepare_answer(message)
         
-        # Log the user message first (without response)
-        log_chat_message(
-            chat_request.message, 
-            "user", 
-            None,  # No response field for user message
-            visitor_id=chat_request.visitor_id,
-            visitor_name=chat_request.visitor_name
-        )
+        # Generate AI response unless the question was already answered
+        if response is None:
+            response = await generate_ai_response(
+                message, search_results, version, semantic_cache=not small_talk
+            )
         
-        # Log the AI response as a separate entry
-        log_chat_message(
-            "", 
-            "bot", 
-            response,  # Response is the message for bot entries
-            visitor_id=chat_request.visitor_id,
-            visitor_name=chat_request.visitor_name
-        )
+        # Log the exchange in the background; the client doesn't need to wait on it
+        run_in_background(asyncio.to_thread(log_exchange, message, response, visitor_id, visitor_name))
         
         # Calculate query time
-        query_time_ms = (time.time() - start_time) * 1000
+        query_time_ms = (time.perf_counter_ns() - t0) / 1_000_000
         
         return models.ChatResponse(
             response=response,
@@ -49,12 +162,47 @@ async def chat(chat_request: models.ChatRequest):
         )
     
     except Exception as e:
-        print(f"Error processing chat: {e}")
+        logger.error("Error processing chat: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to process chat message: {str(e)}"
         )
 
+def format_sse(data):
+    """
+    Format text as a server-sent event, prefixing every line with "data:"
+    """
+    return "".join(f"data: {line}\n" for line in data.split("\n")) + "\n"
+
+@router.post("/stream")
+async def chat_stream(chat_request: models.ChatRequest):
+    """
+    Process a chat message and stream the AI response as server-sent events
+    """
+    message, visitor_id, visitor_name = read_chat_request(chat_request)
+    if not message:
+        return StreamingResponse(iter([format_sse(EMPTY_MESSAGE_RESPONSE)]), media_type="text/event-stream")
+    logger.info("Chat stream message from visitor %s: %s", visitor_id, message_preview(message))
+    
+    version, cached_response, search_results, small_talk = await prepare_answer(message)
+    
+    async def event_stream():
+        if cached_response is not None:
+            chunks = [cached_response]
+            yield format_sse(cached_response)
+        else:
+            chunks = []
+            async for chunk in generate_ai_response_stream(
+                message, search_results, version, semantic_cache=not small_talk
+            ):
+                chunks.append(chunk)
+                yield format_sse(chunk)
+        
+        # Log the full exchange once the stream has finished
+        run_in_background(asyncio.to_thread(log_exchange, message, "".join(chunks), visitor_id, visitor_name))
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @router.get("/history", response_model=models.ChatHistoryResponse)
 async def get_chat_history_endpoint(
     limit: int = 50, 
@@ -63,30 +211,19 @@ async def get_chat_history_endpoint(
     """
     Get chat history, optionally filtered by visitor ID
     """
+    t0 = time.perf_counter_ns()
+    
     try:
         # Get history with optional visitor ID filter
-        history = get_chat_history(limit=limit, visitor_id=visitor_id)
+        history = await asyncio.to_thread(get_chat_history, limit=limit, visitor_id=visitor_id)
         
-        # Convert the history to the expected format
-        formatted_history = []
-        for item in history:
-            formatted_history.append(models.ChatHistoryItem(
-                id=item["id"],
-                message=item["message"],
-                sender=item["sender"],
-                response=item.get("response"),
-                visitor_id=item.get("visitor_id", "anonymous"),
-                visitor_name=item.get("visitor_name"),
-                timestamp=item["timestamp"]
-            ))
-        
-        return models.ChatHistoryResponse(
-            history=formatted_history,
-            count=len(formatted_history)
-        )
+        # Rows already match ChatHistoryItem, so serialize them directly
+        response = ORJSONResponse({"history": history, "count": len(history)})
+        logger.debug("Fetched %d chat history rows in %.1f ms", len(history), (time.perf_counter_ns() - t0) / 1_000_000)
+        return response
     
     except Exception as e:
-        print(f"Error getting chat history: {e}")
+        logger.error("Error getting chat history: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to get chat history: {str(e)}"
@@ -1,10 +1,14 @@
+import asyncio
 from fastapi import APIRouter, HTTPException, Depends
 from typing import Optional
 from datetime import datetime
 
 from app import models
 from app.database import get_profile_data, update_profile_data
-from app.embeddings import add_profile_to_vector_db
+from app.embeddings import enqueue_profile_for_indexing
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
@@ -14,7 +18,7 @@ async def get_profile():
     Get the profile data
     """
     try:
-        profile_data = get_profile_data()
+        profile_data = await asyncio.to_thread(get_profile_data)
         if not profile_data:
             # Return a default profile if none exists
             return models.ProfileData(
@@ -27,7 +31,7 @@ async def get_profile():
         return models.ProfileData(**profile_data)
     
     except Exception as e:
-        print(f"Error getting profile data: {e}")
+        logger.error("Error getting profile data: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to get profile data: {str(e)}"
@@ -46,25 +50,25 @@ async def update_profile(profile_data: models.ProfileData):
         data_dict["updated_at"] = datetime.utcnow().isoformat()
         
         # Update in database
-        print(f"Updating profile with data: {data_dict}")
-        updated_data = update_profile_data(data_dict)
+        logger.debug("Updating profile with data: %s", data_dict)
+        updated_data = await asyncio.to_thread(update_profile_data, data_dict)
         if not updated_data:
             raise HTTPException(
                 status_code=500,
                 detail="Failed to update profile data in database"
             )
         
-        # Add to vector database for search
-        vector_update_success = add_profile_to_vector_db(data_dict)
+        # Queue for indexing in the vector database without waiting on embeddings
+        vector_update_success = await enqueue_profile_for_indexing(data_dict)
         if not vector_update_success:
-            print("Warning: Failed to update vector database")
+            logger.warning("Failed to update vector database")
         
         return models.ProfileData(**updated_data[0] if updated_data else data_dict)
     
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating profile data: {e}")
+        logger.error("Error updating profile data: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to update profile data: {str(e)}"
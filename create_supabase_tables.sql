@@ -104,8 +104,12 @@ ALTER TABLE IF EXISTS messages
 ADD COLUMN IF NOT EXISTS visitor_id TEXT DEFAULT 'anonymous',
 ADD COLUMN IF NOT EXISTS visitor_name TEXT;
 
--- Create index for faster visitor filtering
-CREATE INDEX IF NOT EXISTS idx_messages_visitor_id ON messages(visitor_id);
+-- Create indexes so chat history pages are read in timestamp order without a sort.
+-- (visitor_id, timestamp) also serves plain visitor filtering, so the older
+-- single-column index is dropped to keep inserts cheap
+DROP INDEX IF EXISTS idx_messages_visitor_id;
+CREATE INDEX IF NOT EXISTS idx_messages_visitor_timestamp ON messages(visitor_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp DESC);
 
 -- Create admin_users table if it doesn't exist
 CREATE TABLE IF NOT EXISTS admin_users (